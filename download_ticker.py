@@ -1,12 +1,92 @@
 #!/usr/bin/env python3
 
 import os
+import random
 import sys
+import time
 
-import yfinance as yf
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
 
+# Hive-partitioned dataset root; read with pd.read_parquet(PARQUET_DATASET, filters=...)
+PARQUET_DATASET = "historical_data.parquet"
 
-def download_ticker_data(ticker_symbol=None):
+
+RATE_LIMIT_RETRIES = 3
+
+
+def retry_rate_limited(fetch):
+    """Call fetch(), backing off with jitter and retrying while Yahoo answers 429."""
+    from yfinance.exceptions import YFRateLimitError
+
+    for attempt in range(RATE_LIMIT_RETRIES):
+        try:
+            return fetch()
+        except YFRateLimitError:
+            time.sleep(2**attempt + random.random())
+    return fetch()
+
+
+def history_path(ticker_symbol, file_format="csv"):
+    """Return the per-ticker CSV file, or the ticker's partition of the Parquet dataset."""
+    if file_format == "parquet":
+        return os.path.join(PARQUET_DATASET, f"ticker={ticker_symbol}", "data.parquet")
+    return os.path.join("historical_data", f"{ticker_symbol}.csv")
+
+
+def trim_history(hist_data):
+    """Keep only the OHLCV columns, as float32 prices and int64 volume.
+
+    Each bar keeps the instant of its exchange-local midnight, stored in UTC, so
+    every partition shares one timezone and the web app still labels bars with
+    their trading date.
+    """
+    hist_data = (
+        hist_data[OHLCV_COLUMNS]
+        .dropna()
+        .astype(
+            {
+                "Open": "float32",
+                "High": "float32",
+                "Low": "float32",
+                "Close": "float32",
+                "Volume": "int64",
+            }
+        )
+    )
+    hist_data.index = hist_data.index.normalize().tz_convert("UTC")
+    return hist_data
+
+
+def save_history(hist_data, file_path):
+    """Write OHLCV history to CSV or Parquet, depending on the file extension.
+
+    The data goes to a hidden temp file that then replaces file_path, so an
+    interrupted write never leaves a truncated file behind.
+    """
+    dir_name, base_name = os.path.split(file_path)
+    # Dot-prefixed so pyarrow's dataset discovery and the *.csv scan skip it
+    tmp_path = os.path.join(dir_name, f".{base_name}.tmp")
+
+    try:
+        if file_path.endswith(".parquet"):
+            # Each ticker= partition is its own directory; the CSV folder is made once by the caller
+            os.makedirs(dir_name, exist_ok=True)
+            hist_data.to_parquet(tmp_path, engine="pyarrow", compression="snappy")
+        else:
+            # pyarrow's C++ CSV encoder is much faster than DataFrame.to_csv
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+
+            table = pa.Table.from_pandas(hist_data.reset_index(), preserve_index=False)
+            pa_csv.write_csv(table, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def download_ticker_data(ticker_symbol=None, file_format="csv"):
     # Get ticker input from command line argument or user input
     if ticker_symbol is None:
         if len(sys.argv) > 1:
@@ -16,12 +96,25 @@ def download_ticker_data(ticker_symbol=None):
     else:
         ticker_symbol = ticker_symbol.upper()
 
+    try:
+        # Imported here so importing save_history/trim_history stays cheap
+        import yfinance as yf
+        from yfinance.exceptions import YFException
+
+    except ImportError as e:
+        print(f"An error occurred: {e}")
+        print(
+            "Please ensure you have the 'yfinance', 'pandas' and 'pyarrow' libraries installed."
+        )
+        print("You can install them using: pip install yfinance pandas pyarrow")
+        return False
+
     try:
         # Create a Ticker object
         ticker = yf.Ticker(ticker_symbol)
 
         # Get company information
-        info = ticker.info
+        info = retry_rate_limited(lambda: ticker.info)
 
         if not info or "shortName" not in info:
             print(
@@ -56,34 +149,41 @@ def download_ticker_data(ticker_symbol=None):
 
         # Download historical data (OHLCV)
         print(f"Downloading historical data for {ticker_symbol}...")
-        hist_data = ticker.history(
-            period="max")  # "max" downloads all available data
+        hist_data = retry_rate_limited(
+            lambda: ticker.history(period="max")
+        )  # "max" downloads all available data
 
         if hist_data.empty:
             print(f"No historical data found for {ticker_symbol}.")
             return False
 
-        # Define the folder and filename
-        folder_name = "historical_data"
-        if not os.path.exists(folder_name):
-            os.makedirs(folder_name)
+        hist_data = trim_history(hist_data)
+
+        if hist_data.empty:
+            print(f"No complete OHLCV rows found for {ticker_symbol}.")
+            return False
 
-        file_name = f"{ticker_symbol}.csv"
-        file_path = os.path.join(folder_name, file_name)
+        # Define the output path
+        if file_format == "csv":
+            os.makedirs("historical_data", exist_ok=True)
+        file_path = history_path(ticker_symbol, file_format)
 
-        # Save the data to a CSV file
-        hist_data.to_csv(file_path)
+        # Save the data to a CSV or Parquet file
+        save_history(hist_data, file_path)
         print(f"Historical data saved to {file_path}")
         return True
 
-    except Exception as e:
+    # Network (OSError), Yahoo, malformed-response and pyarrow errors
+    except (YFException, OSError, KeyError, ValueError, TypeError) as e:
         print(f"An error occurred: {e}")
-        print(
-            "Please ensure you have the 'yfinance' and 'pandas' libraries installed."
-        )
-        print("You can install them using: pip install yfinance pandas")
         return False
 
 
 if __name__ == "__main__":
-    download_ticker_data()
+    # CSV stays the default because the web app reads historical_data/*.csv
+    file_format = "csv"
+    if "--parquet" in sys.argv:
+        sys.argv.remove("--parquet")
+        file_format = "parquet"
+
+    download_ticker_data(file_format=file_format)
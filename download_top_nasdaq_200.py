@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 
+import hashlib
+import math
 import os
+import queue
 import sys
+import threading
 import time
 import pandas as pd
+from pandas.tseries.offsets import BDay
 import yfinance as yf
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 import requests
-from typing import List, Tuple
+from curl_cffi import requests as curl_requests
+from tqdm import tqdm
+from typing import List, Optional, Tuple
 import json
+import multitasking
+
+from download_ticker import PARQUET_DATASET, history_path, save_history, trim_history
 
 
 def get_top_nasdaq_stocks(count: int = 200) -> List[str]:
@@ -22,67 +33,324 @@ def get_top_nasdaq_stocks(count: int = 200) -> List[str]:
         print("Please create a nasdaq_tickers.txt file with one ticker per line.")
         return []
 
-    # Read tickers from file
-    tickers = []
+    # Read tickers from file, stopping as soon as count tickers are found
     try:
         with open(ticker_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                # Skip empty lines and comments
-                if line and not line.startswith("#"):
-                    tickers.append(line.upper())
+            lines = (line.strip() for line in f)
+            # Skip empty lines and comments
+            tickers = list(
+                islice((l.upper() for l in lines if l and not l.startswith("#")), count)
+            )
 
         print(f"Loaded {len(tickers)} tickers from {ticker_file}")
 
         if len(tickers) < count:
             print(f"Note: Found {len(tickers)} tickers, will download all available.")
-            return tickers
 
-        return tickers[:count]
+        return tickers
 
-    except Exception as e:
+    except (OSError, ValueError) as e:
         print(f"Error reading {ticker_file}: {e}")
         return []
 
 
-def download_single_ticker(
-    ticker: str, folder_name: str = "historical_data"
-) -> Tuple[str, bool, str]:
+# Yahoo's chart endpoint handles roughly this many symbols per request
+BATCH_SIZE = 20
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def last_market_close() -> pd.Timestamp:
+    """
+    Return the most recent weekday 4 PM ET close (exchange holidays are not modelled).
+    """
+    now = pd.Timestamp.now(tz="America/New_York")
+    # Wall-clock 4 PM; adding a 16h Timedelta is off by an hour on DST-change days
+    close = now.normalize().replace(hour=16)
+    if now < close or now.dayofweek >= 5:
+        close -= BDay(1)
+    return close
+
+
+def load_manifest(folder_name: str = "historical_data") -> dict:
     """
-    Download historical data for a single ticker.
-    Returns: (ticker, success, message)
+    Load the file path -> {last_date, fetched, mtime, sha1} freshness manifest.
     """
     try:
-        # Create folder if it doesn't exist
-        if not os.path.exists(folder_name):
-            os.makedirs(folder_name)
+        with open(os.path.join(folder_name, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest: dict, folder_name: str = "historical_data"):
+    """
+    Write the manifest atomically, so an interrupted save never leaves it corrupt.
+    """
+    manifest_path = os.path.join(folder_name, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def file_sha1(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def read_last_date(file_path: str) -> str:
+    """
+    Return the date (YYYY-MM-DD) of the last row in a saved history file.
+    """
+    if file_path.endswith(".parquet"):
+        index = pd.read_parquet(file_path, columns=["Close"]).index
+        return index[-1].strftime("%Y-%m-%d") if len(index) else ""
+
+    # Only the tail of a CSV is needed to find its last row
+    with open(file_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().decode().strip().splitlines()
+    date = lines[-1].split(",", 1)[0][:10] if lines else ""
+    return date if date[:1].isdigit() else ""
+
+
+def record_download(manifest: dict, file_path: str, last_date: str):
+    mtime = os.path.getmtime(file_path)
+    manifest[file_path] = {
+        "last_date": last_date,
+        "fetched": mtime,
+        "mtime": mtime,
+        "sha1": file_sha1(file_path),
+    }
+
+
+def scan_mtimes(file_format: str = "csv") -> dict:
+    """
+    Map file path -> mtime for every saved history file, in one directory pass.
+    Parquet partitions live one directory down, so each still needs a stat.
+    """
+    if file_format == "parquet":
+        mtimes = {}
+        try:
+            with os.scandir(PARQUET_DATASET) as entries:
+                for entry in entries:
+                    if entry.name.startswith("ticker="):
+                        file_path = os.path.join(entry.path, "data.parquet")
+                        try:
+                            mtimes[file_path] = os.stat(file_path).st_mtime
+                        except FileNotFoundError:
+                            pass
+        except FileNotFoundError:
+            pass
+        return mtimes
+
+    with os.scandir("historical_data") as entries:
+        return {
+            entry.path: entry.stat().st_mtime
+            for entry in entries
+            if entry.name.endswith(".csv")
+        }
+
+
+def is_up_to_date(
+    file_path: str, mtime: Optional[float], manifest: dict, close: pd.Timestamp
+) -> bool:
+    """
+    Check whether a saved file already holds data fetched after the given close.
+    The manifest entry is trusted while the file's mtime matches; on an mtime
+    miss the content hash decides whether only the metadata needs refreshing.
+    A file that cannot be read or parsed counts as stale, so it is downloaded again.
+    """
+    if mtime is None:
+        return False
+
+    entry = manifest.get(file_path)
+
+    if entry is None or entry["mtime"] != mtime:
+        try:
+            sha1 = file_sha1(file_path)
+            if entry is not None and entry["sha1"] == sha1:
+                entry["mtime"] = mtime
+            else:
+                entry = {
+                    "last_date": read_last_date(file_path),
+                    "fetched": mtime,
+                    "mtime": mtime,
+                    "sha1": sha1,
+                }
+                manifest[file_path] = entry
+
+        # Truncated or half-written files (pyarrow raises ArrowInvalid, a ValueError)
+        except (OSError, ValueError):
+            manifest.pop(file_path, None)
+            return False
+
+    return (
+        entry["last_date"] >= close.strftime("%Y-%m-%d")
+        and entry["fetched"] >= close.timestamp()
+    )
+
+
+# Gateway errors Yahoo returns under load; unlike other statuses they pass on retry
+RETRY_STATUSES = {502, 503, 504}
+
+
+class RetrySession(curl_requests.Session):
+    """
+    curl_cffi's RetryStrategy only retries transport errors (resets, timeouts),
+    so gateway error statuses are retried here with the same exponential backoff.
+    """
+
+    def request(self, *args, **kwargs):
+        for attempt in range(self.retry.count):
+            response = super().request(*args, **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            time.sleep(self.retry.delay * 2**attempt)
+        return super().request(*args, **kwargs)
+
+
+def new_session() -> curl_requests.Session:
+    """
+    Create the session shared by every batch, so Yahoo's cookie/crumb is fetched
+    once rather than per yf.download call. Connections are not pooled across
+    symbols: curl handles are per thread and yfinance fetches each symbol on a
+    new thread. Transport errors and 502/503/504 responses are retried with
+    exponential backoff.
+    """
+    return RetrySession(
+        impersonate="chrome",
+        retry=curl_requests.RetryStrategy(count=3, delay=0.3, backoff="exponential"),
+    )
+
+
+def start_status_logger() -> Tuple[queue.SimpleQueue, threading.Thread]:
+    """
+    Print per-ticker status lines from a single background thread, so workers
+    only enqueue (ticker, success, message) and never wait on the terminal.
+    Put None on the queue and join the thread to flush it.
+    """
+    status_queue = queue.SimpleQueue()
 
-        file_path = os.path.join(folder_name, f"{ticker}.csv")
+    def drain():
+        while (item := status_queue.get()) is not None:
+            ticker, success, message = item
+            tqdm.write(f"{'✓' if success else '✗'} {ticker:6} - {message}")
 
-        # Skip if file already exists and is recent (less than 1 day old)
-        if os.path.exists(file_path):
-            file_age = time.time() - os.path.getmtime(file_path)
-            if file_age < 86400:  # 24 hours
-                return ticker, True, "Already exists (recent)"
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+    return status_queue, thread
 
-        # Create ticker object and download data
-        stock = yf.Ticker(ticker)
-        hist_data = stock.history(period="max")
 
-        if hist_data.empty:
-            return ticker, False, "No data available"
+def download_ticker_batch(
+    tickers: List[str],
+    session: Optional[curl_requests.Session] = None,
+    status_queue: Optional[queue.SimpleQueue] = None,
+) -> Tuple[List[Tuple[str, pd.DataFrame]], List[Tuple[str, bool, str]]]:
+    """
+    Download historical data for a batch of tickers with a single request.
+    Saving is left to write_ticker_history so this thread can return to the network.
+    Failures carry only the exception type name; nothing is formatted per error.
+    Returns: ([(ticker, hist_data)], [(ticker, False, reason)] for failures)
+    """
+    frames = []
+    results = []
 
-        # Save to CSV
-        hist_data.to_csv(file_path)
-        return ticker, True, f"Downloaded {len(hist_data)} records"
+    def report(ticker: str, success: bool, message: str):
+        results.append((ticker, success, message))
+        if status_queue is not None:
+            status_queue.put((ticker, success, message))
 
+    try:
+        # yf.Tickers(...).history() runs this same download but also builds a Ticker
+        # object per symbol, so the batch calls yf.download directly.
+        # auto_adjust/ignore_tz match Ticker.history()'s prices and dates; actions are
+        # skipped because trim_history keeps only the OHLCV columns.
+        # Each symbol is fetched on its own multitasking thread; the pool created in
+        # download_nasdaq_200_bulk is what bounds how many run at once.
+        data = yf.download(
+            " ".join(tickers),
+            period="max",
+            group_by="ticker",
+            threads=True,
+            progress=False,
+            auto_adjust=True,
+            actions=False,
+            ignore_tz=False,
+            session=session,
+        )
+
+    # yf.download records per-symbol errors (rate limits included) itself and
+    # returns those symbols empty, so only session-level failures surface here.
+    # Anything else it raises fails this batch alone rather than the whole run.
     except Exception as e:
-        return ticker, False, f"Error: {str(e)}"
+        for ticker in tickers:
+            report(ticker, False, type(e).__name__)
+        return frames, results
+
+    downloaded = set() if data is None else set(data.columns.get_level_values(0))
+
+    for ticker in tickers:
+        try:
+            if ticker not in downloaded:
+                report(ticker, False, "No data available")
+                continue
+
+            hist_data = data[ticker].dropna(how="all")
+
+            # Checked before trimming: if every symbol failed, the index is empty
+            # and tz-naive, which trim_history's UTC conversion rejects
+            if hist_data.empty:
+                report(ticker, False, "No data available")
+                continue
+
+            hist_data = trim_history(hist_data)
+
+            if hist_data.empty:
+                report(ticker, False, "No data available")
+                continue
 
+            frames.append((ticker, hist_data))
 
-def download_nasdaq_200_bulk(max_workers: int = 10):
+        except (KeyError, ValueError, TypeError) as e:
+            report(ticker, False, type(e).__name__)
+
+    return frames, results
+
+
+def write_ticker_history(
+    ticker: str,
+    hist_data: pd.DataFrame,
+    manifest: dict,
+    file_format: str = "csv",
+    status_queue: Optional[queue.SimpleQueue] = None,
+) -> Tuple[str, bool, str]:
+    """
+    Save one downloaded ticker and record it in the freshness manifest.
+    Returns: (ticker, success, message or exception type name)
+    """
+    try:
+        # Save to CSV or Parquet
+        file_path = history_path(ticker, file_format)
+        save_history(hist_data, file_path)
+        record_download(manifest, file_path, hist_data.index[-1].strftime("%Y-%m-%d"))
+        result = (ticker, True, f"Downloaded {len(hist_data)} records")
+
+    # Filesystem and pyarrow encoding errors
+    except (OSError, ValueError, TypeError) as e:
+        result = (ticker, False, type(e).__name__)
+
+    if status_queue is not None:
+        status_queue.put(result)
+    return result
+
+
+def download_nasdaq_200_bulk(max_requests: int = 64, file_format: str = "csv"):
     """
     Download historical data for NASDAQ stocks with parallel processing.
+    max_requests bounds the number of HTTP requests in flight at once.
     """
     print("=== NASDAQ Stocks Historical Data Downloader ===\n")
 
@@ -93,32 +361,96 @@ def download_nasdaq_200_bulk(max_workers: int = 10):
     # Download with progress tracking
     successful = []
     failed = []
-
-    print(f"Starting parallel download with {max_workers} workers...\n")
+    os.makedirs("historical_data", exist_ok=True)
+    manifest = load_manifest()
+    close = last_market_close()
+    session = new_session()
+
+    # Skip files that already cover the last market close, before submitting any work
+    mtimes = scan_mtimes(file_format=file_format)
+    to_download = []
+    for ticker in tickers:
+        file_path = history_path(ticker, file_format)
+        if is_up_to_date(file_path, mtimes.get(file_path), manifest, close):
+            successful.append(ticker)
+        else:
+            to_download.append(ticker)
+
+    print(f"{len(successful)} tickers already up to date\n")
+
+    batches = [
+        to_download[i : i + BATCH_SIZE]
+        for i in range(0, len(to_download), BATCH_SIZE)
+    ]
+
+    # Enough batches in flight to keep max_requests symbol fetches busy
+    max_workers = math.ceil(max_requests / BATCH_SIZE)
+    # pyarrow releases the GIL while encoding, so writer threads use spare cores
+    write_workers = max(1, (os.cpu_count() or 2) // 2)
+
+    print(
+        f"Starting parallel download of {len(batches)} batches "
+        f"with up to {max_requests} concurrent requests...\n"
+    )
     start_time = time.time()
+    status_queue, status_logger = start_status_logger()
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all download tasks
-        future_to_ticker = {
-            executor.submit(download_single_ticker, ticker): ticker
-            for ticker in tickers
-        }
+    # yfinance's fetch threads all wait on the current multitasking pool, which it
+    # sizes once at import; a fresh pool caps fetches in flight across all batches.
+    # Pools below 2 threads run unbounded or synchronously, so 2 is the floor.
+    multitasking.createPool("blink-download", threads=max(2, max_requests))
 
-        # Process completed downloads
-        for i, future in enumerate(as_completed(future_to_ticker), 1):
-            ticker = future_to_ticker[future]
-            ticker_result, success, message = future.result()
-
-            if success:
-                successful.append(ticker_result)
-                status = "✓"
-            else:
-                failed.append((ticker_result, message))
-                status = "✗"
-
-            # Progress update
-            progress = (i / len(tickers)) * 100
-            print(f"[{progress:5.1f}%] {status} {ticker_result:6} - {message}")
+    # The manifest is saved even if the run is interrupted, so finished files stay skipped
+    try:
+        with (
+            ThreadPoolExecutor(max_workers=max_workers) as executor,
+            ThreadPoolExecutor(max_workers=write_workers) as writer,
+        ):
+            # Submit all download tasks
+            futures = [
+                executor.submit(
+                    download_ticker_batch,
+                    batch,
+                    session=session,
+                    status_queue=status_queue,
+                )
+                for batch in batches
+            ]
+            write_futures = []
+
+            # Hand completed downloads to the writers; per-ticker lines come from the status logger
+            with tqdm(total=len(to_download), unit="tk") as progress:
+                for future in as_completed(futures):
+                    frames, failures = future.result()
+
+                    for ticker_result, _, message in failures:
+                        failed.append((ticker_result, message))
+                    progress.update(len(failures))
+
+                    for ticker, hist_data in frames:
+                        write_future = writer.submit(
+                            write_ticker_history,
+                            ticker,
+                            hist_data,
+                            manifest,
+                            file_format=file_format,
+                            status_queue=status_queue,
+                        )
+                        # Advance the bar as each save lands, not once downloading ends
+                        write_future.add_done_callback(lambda _: progress.update(1))
+                        write_futures.append(write_future)
+
+                for future in as_completed(write_futures):
+                    ticker_result, success, message = future.result()
+
+                    if success:
+                        successful.append(ticker_result)
+                    else:
+                        failed.append((ticker_result, message))
+    finally:
+        status_queue.put(None)
+        status_logger.join()
+        save_manifest(manifest)
 
     # Summary
     elapsed_time = time.time() - start_time
@@ -134,7 +466,8 @@ def download_nasdaq_200_bulk(max_workers: int = 10):
         for ticker, reason in failed:
             print(f"  {ticker}: {reason}")
 
-    print(f"\nHistorical data saved to: ./historical_data/")
+    output = PARQUET_DATASET if file_format == "parquet" else "historical_data"
+    print(f"\nHistorical data saved to: ./{output}/")
     return successful, failed
 
 
@@ -142,21 +475,28 @@ def main():
     """Main function to run the script."""
 
     # Parse command line arguments
-    max_workers = 10
+    max_requests = 64
+    file_format = "csv"
 
-    if len(sys.argv) > 1:
+    args = sys.argv[1:]
+    if "--parquet" in args:
+        args.remove("--parquet")
+        file_format = "parquet"
+
+    if args:
         try:
-            max_workers = int(sys.argv[1])
+            max_requests = int(args[0])
         except ValueError:
-            print("Invalid max_workers argument. Using default: 10")
+            print("Invalid max_requests argument. Using default: 64")
 
     print(f"Configuration:")
-    print(f"  Max workers: {max_workers}")
+    print(f"  Max concurrent requests: {max_requests}")
+    print(f"  File format: {file_format}")
     print()
 
     # Run the bulk download
     try:
-        successful, failed = download_nasdaq_200_bulk(max_workers)
+        successful, failed = download_nasdaq_200_bulk(max_requests, file_format)
 
         if successful:
             print(f"\n✓ Successfully downloaded data for {len(successful)} stocks!")
@@ -166,10 +506,8 @@ def main():
 
     except KeyboardInterrupt:
         print("\n\nDownload interrupted by user.")
-    except Exception as e:
+    except (OSError, ValueError) as e:
         print(f"\nAn error occurred: {e}")
-        print("Please ensure you have the required libraries installed:")
-        print("pip install yfinance pandas requests")
 
 
 if __name__ == "__main__":
@@ -1,50 +1,107 @@
 #!/usr/bin/env python3
 """Fetch company info from Yahoo Finance and output as JSON."""
 
-import json
+import functools
+import os
 import sys
+import time
 
-import yfinance as yf
+import orjson
+
+from download_ticker import retry_rate_limited
+
+CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "blink", "company_info.json"
+)
+
+
+def load_cache() -> dict:
+    """Load the on-disk cache of company info, keyed by "TICKER:YYYYMMDD"."""
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+
+def save_cache(cache: dict):
+    """Write the cache atomically so concurrent invocations never see a partial file."""
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(orjson.dumps(cache))
+        os.replace(tmp_file, CACHE_FILE)
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=1024)
+def fetch_company_info(symbol: str) -> dict:
+    """Fetch company info for an upper-cased symbol, reusing today's cached copy."""
+    today = time.strftime("%Y%m%d")
+    key = f"{symbol}:{today}"
+
+    cache = load_cache()
+    if key in cache:
+        return cache[key]
+
+    # Imported here so the usage error and cache hits skip yfinance's import cost
+    import yfinance as yf
+    from yfinance.exceptions import YFException
+
+    try:
+        info = retry_rate_limited(lambda: yf.Ticker(symbol).info)
+    except (YFException, OSError, KeyError, ValueError) as e:
+        return {"error": str(e)}
+
+    if not info or "shortName" not in info:
+        return {"error": f"Could not find company info for {symbol}"}
+
+    # Get a short description - truncate if too long
+    description = info.get("longBusinessSummary", "")
+    if len(description) > 500:
+        # Truncate at last sentence boundary before 500 chars
+        truncated = description[:500]
+        head, sep, _ = truncated.rpartition(".")
+        description = head + sep if sep and len(head) > 200 else truncated + "..."
+
+    result = {
+        "ticker": symbol,
+        "name": info.get("shortName") or info.get("longName", "N/A"),
+        "industry": info.get("industry", "N/A"),
+        "sector": info.get("sector", "N/A"),
+        "description": description,
+    }
+
+    # Only today's entries are kept, so the cache never outgrows one day of lookups
+    cache = {k: v for k, v in cache.items() if k.endswith(today)}
+    cache[key] = result
+    save_cache(cache)
+    return result
 
 
 def get_company_info(ticker_symbol: str) -> dict:
     """Get company name, industry, and description for a ticker."""
     try:
-        ticker = yf.Ticker(ticker_symbol.upper())
-        info = ticker.info
-
-        if not info or "shortName" not in info:
-            return {"error": f"Could not find company info for {ticker_symbol}"}
-
-        # Get a short description - truncate if too long
-        description = info.get("longBusinessSummary", "")
-        if len(description) > 500:
-            # Truncate at last sentence boundary before 500 chars
-            truncated = description[:500]
-            last_period = truncated.rfind(".")
-            if last_period > 200:
-                description = truncated[: last_period + 1]
-            else:
-                description = truncated + "..."
-
-        return {
-            "ticker": ticker_symbol.upper(),
-            "name": info.get("shortName") or info.get("longName", "N/A"),
-            "industry": info.get("industry", "N/A"),
-            "sector": info.get("sector", "N/A"),
-            "description": description,
-        }
+        return fetch_company_info(ticker_symbol.upper())
 
+    # dev/server.js expects JSON on stdout whatever goes wrong inside yfinance
     except Exception as e:
         return {"error": str(e)}
 
 
+def write_json(result: dict):
+    """Write result to stdout as a single line of UTF-8 JSON, skipping str encoding."""
+    sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE))
+    sys.stdout.flush()
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print(json.dumps({"error": "No ticker symbol provided"}))
+        write_json({"error": "No ticker symbol provided"})
         sys.exit(1)
 
     ticker = sys.argv[1]
     result = get_company_info(ticker)
-    print(json.dumps(result))
-
+    write_json(result)